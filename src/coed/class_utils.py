@@ -1,11 +1,37 @@
 import importlib
 import inspect
+import sys
+from functools import lru_cache
 from typing import Tuple, Any
+from weakref import WeakKeyDictionary
+
+CLASS_NAME_CACHE = WeakKeyDictionary()
+""" cache of class to classname relation (a.b.Cls) """
+
+MODULE_NAME_CACHE = dict()
+""" cache of (module, class name) to fixed (module, class name) relation """
+
+
+def _is_initializing(module: str) -> bool:
+    """
+    Checks whether the module is still being imported (or failed to import).
+
+    :param module: the module to check
+    :type module: str
+    :return: True if not (fully) imported yet
+    :rtype: bool
+    """
+    m = sys.modules.get(module)
+    if m is None:
+        return True
+    return getattr(getattr(m, "__spec__", None), "_initializing", False)
 
 
 def fix_module_name(module: str, cls: str) -> Tuple[str, str]:
     """
     Turns a.b._C.C into a.b.C if possible.
+    Results only get cached once they cannot change anymore, i.e., not
+    while the parent module is still being imported.
 
     :param module: the module
     :type module: str
@@ -13,16 +39,27 @@ def fix_module_name(module: str, cls: str) -> Tuple[str, str]:
     :type cls: str
     :return: the (potentially) updated tuple of module and class name
     """
-    if module.split(".")[-1].startswith("_"):
+    key = (module, cls)
+    result = MODULE_NAME_CACHE.get(key)
+    if result is not None:
+        return result
+
+    cache = True
+    module_short, sep, tail = module.rpartition(".")
+    if sep and tail.startswith("_"):
         try:
-            module_short = ".".join(module.split(".")[:-1])
             getattr(importlib.import_module(module_short), cls)
             module = module_short
         except Exception:
-            pass
-    return module, cls
+            # parent module might not have finished importing yet, try again next time
+            cache = not _is_initializing(module_short)
+    result = (module, cls)
+    if cache:
+        MODULE_NAME_CACHE[key] = result
+    return result
 
 
+@lru_cache(maxsize=8192)
 def class_name_to_type(classname: str) -> Any:
     """
     Turns the class name into a type.
@@ -32,9 +69,7 @@ def class_name_to_type(classname: str) -> Any:
     :return: the type
     :rtype: type
     """
-    p = classname.split(".")
-    m = ".".join(p[:-1])
-    c = p[-1]
+    m, _, c = classname.rpartition(".")
     return getattr(importlib.import_module(m), c)
 
 
@@ -50,5 +85,11 @@ def get_class_name(o: Any) -> str:
         cls = o
     else:
         cls = type(o)
-    m, c = fix_module_name(cls.__module__, cls.__name__)
-    return m + "." + c
+    result = CLASS_NAME_CACHE.get(cls)
+    if result is None:
+        m, c = fix_module_name(cls.__module__, cls.__name__)
+        result = m + "." + c
+        # only cache final results
+        if (cls.__module__, cls.__name__) in MODULE_NAME_CACHE:
+            CLASS_NAME_CACHE[cls] = result
+    return result
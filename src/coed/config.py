@@ -1,10 +1,9 @@
 import abc
 import json
 from collections import OrderedDict
-from datetime import datetime
 from typing import List, Union, Optional, Any, Dict
 from coed.class_utils import class_name_to_type, get_class_name
-from coed.logging import LoggableObject
+from coed.logging import LoggableObject, timestamp
 from coed.serialization.objects import get_dict_reader, get_dict_writer, add_dict_writer, add_dict_reader, has_dict_reader, has_dict_writer
 from coed.serialization.vars import get_string_reader
 from coed.vars import is_valid_name, is_var, pad_var, unpad_var, VariableHandler, Variables
@@ -624,7 +623,7 @@ class AbstractOptionHandler(LoggableObject, VariableHandler, abc.ABC):
 
         :param args: the arguments to log
         """
-        print(*("%s - %s -" % (self.log_prefix, str(datetime.now())), *args))
+        print(*("%s - %s -" % (self.log_prefix, timestamp()), *args))
 
 
 def dict_to_optionhandler(d: Dict) -> AbstractOptionHandler:
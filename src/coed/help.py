@@ -41,5 +41,5 @@ class AbstractHelpGenerator(AbstractOptionHandler, abc.ABC):
         if output_path is None:
             print(help)
         else:
-            with open(output_path, "w") as hf:
+            with open(output_path, "w", encoding="utf-8") as hf:
                 hf.write(help)
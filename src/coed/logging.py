@@ -1,5 +1,26 @@
+import time
 import traceback
-from datetime import datetime
+
+TIMESTAMP_CACHE = (None, None)
+""" the last formatted second (seconds since epoch, formatted string) """
+
+
+def timestamp() -> str:
+    """
+    Returns the current local time as string (YYYY-MM-DD HH:MM:SS.ffffff).
+    The date/time part is only formatted once per second.
+
+    :return: the timestamp
+    :rtype: str
+    """
+    global TIMESTAMP_CACHE
+    now = time.time()
+    sec = int(now)
+    cached_sec, cached_str = TIMESTAMP_CACHE
+    if cached_sec != sec:
+        cached_str = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(sec))
+        TIMESTAMP_CACHE = (sec, cached_str)
+    return "%s.%06d" % (cached_str, int((now - sec) * 1000000))
 
 
 def log(*args):
@@ -8,7 +29,7 @@ def log(*args):
 
     :param args: the arguments to log
     """
-    print(*("%s - " % str(datetime.now()), *args))
+    print(*("%s - " % timestamp(), *args))
 
 
 def handle_exception(msg: str, loggable: 'LoggableObject' = None) -> str:
@@ -32,13 +53,15 @@ class LoggableObject:
     Ancestor for objects that can output logging information.
     """
 
+    __slots__ = ()
+
     def log(self, *args):
         """
         Logs the arguments.
 
         :param args: the arguments to log
         """
-        print(*("%s - %s -" % (type(self).__name__, str(datetime.now())), *args))
+        print(*("%s - %s -" % (type(self).__name__, timestamp()), *args))
 
     def _handle_exception(self, msg: str) -> str:
         """
@@ -1,11 +1,14 @@
+import hashlib
 import importlib
+import importlib.util
 import inspect
+import json
 import os
 import sys
 import traceback
-from typing import Callable, Union, List, Optional, Type
+from typing import Any, Callable, Union, List, Optional, Type, Dict, Iterator, Tuple
 
-from pkg_resources import working_set
+from importlib.metadata import entry_points, distributions
 
 from .class_utils import get_class_name, class_name_to_type
 
@@ -15,6 +18,40 @@ DEFAULT = "DEFAULT"
 LIST_CLASSES = "list_classes"
 """ the default method for listing classes. """
 
+ENTRY_POINT_GROUP = "class_lister"
+""" the entry point group that class listers are registered under. """
+
+ENTRY_POINTS_CACHE = dict()
+""" cache of entry point group -> entry points (tuple) """
+
+
+def get_entry_points(group: str) -> Tuple:
+    """
+    Returns the entry points registered under the specified group.
+    The entry points get cached, use reload_entry_points() to pick up
+    distributions that were installed at runtime.
+
+    :param group: the group to get the entry points for
+    :type group: str
+    :return: the entry points
+    :rtype: tuple
+    """
+    if group not in ENTRY_POINTS_CACHE:
+        eps = entry_points()
+        # Python 3.10+ returns EntryPoints, older versions a dict of group -> list
+        if hasattr(eps, "select"):
+            ENTRY_POINTS_CACHE[group] = tuple(eps.select(group=group))
+        else:
+            ENTRY_POINTS_CACHE[group] = tuple(eps.get(group, []))
+    return ENTRY_POINTS_CACHE[group]
+
+
+def reload_entry_points():
+    """
+    Clears the cached entry points, so they get re-read on the next access.
+    """
+    ENTRY_POINTS_CACHE.clear()
+
 
 def get_class_lister(class_lister: str) -> Callable:
     """
@@ -53,7 +90,8 @@ class Registry:
     """
 
     def __init__(self, default_class_listers: Union[str, List[str]] = None, env_class_listers: str = None,
-                 excluded_class_listers: Union[str, List[str]] = None, env_excluded_class_listers: str = None):
+                 excluded_class_listers: Union[str, List[str]] = None, env_excluded_class_listers: str = None,
+                 instantiate_probe: bool = False, cache_dir: str = None):
         """
         Initializes the registry.
 
@@ -65,19 +103,43 @@ class Registry:
         :type excluded_class_listers: str or list
         :param env_excluded_class_listers: the environmenr variable to retrieve the excluded class lister(s) from
         :type env_excluded_class_listers: str
+        :param instantiate_probe: whether to instantiate candidate classes and skip the ones that fail to instantiate
+        :type instantiate_probe: bool
+        :param cache_dir: the directory to persist the determined classes in across sessions, None to disable
+        :type cache_dir: str
         """
 
         self._classes = dict()
+        self._class_lister_dicts = dict()
+        self._module_classes = dict()
+        self._cache_file = None
+        self._cached_classes = None
+        self._scan_failed = False
         self._default_class_listers = None
         self._env_class_listers = None
         self._excluded_class_listers = None
+        self._excluded_class_listers_set = frozenset()
         self._env_excluded_class_listers = None
         self._custom_class_listers = None
+        self._instantiate_probe = False
+        self._cache_dir = None
 
         self.default_class_listers = default_class_listers
         self.env_class_listers = env_class_listers
         self.excluded_class_listers = excluded_class_listers
         self.env_excluded_class_listers = env_excluded_class_listers
+        self.instantiate_probe = instantiate_probe
+        self.cache_dir = cache_dir
+
+    def _clear_cache(self):
+        """
+        Clears the class cache, the cached class lister output and the scanned modules.
+        """
+        self._classes = dict()
+        self._class_lister_dicts = dict()
+        self._module_classes = dict()
+        self._cache_file = None
+        self._cached_classes = None
 
     @property
     def default_class_listers(self) -> Optional[List[str]]:
@@ -106,7 +168,7 @@ class Registry:
         else:
             raise Exception("default_class_listers must be either str or list, but got: %s" % str(type(class_listers)))
         self._default_class_listers = class_listers
-        self._classes = dict()
+        self._clear_cache()
 
     @property
     def env_class_listers(self) -> Optional[str]:
@@ -127,7 +189,7 @@ class Registry:
         :type class_listers: str
         """
         self._env_class_listers = class_listers
-        self._classes = dict()
+        self._clear_cache()
 
     @property
     def excluded_class_listers(self) -> Optional[List[str]]:
@@ -156,7 +218,8 @@ class Registry:
         else:
             raise Exception("excluded_class_listers must be either str or list, but got: %s" % str(type(excluded_class_listers)))
         self._excluded_class_listers = excluded_class_listers
-        self._classes = dict()
+        self._excluded_class_listers_set = frozenset(excluded_class_listers)
+        self._clear_cache()
 
     @property
     def env_excluded_class_listers(self) -> Optional[str]:
@@ -177,7 +240,7 @@ class Registry:
         :type excluded_class_listers: str
         """
         self._env_excluded_class_listers = excluded_class_listers
-        self._classes = dict()
+        self._clear_cache()
 
     @property
     def custom_class_listers(self) -> Optional[List[str]]:
@@ -198,7 +261,68 @@ class Registry:
         :type class_listers: list
         """
         self._custom_class_listers = class_listers
-        self._classes = dict()
+        self._clear_cache()
+
+    @property
+    def instantiate_probe(self) -> bool:
+        """
+        Returns whether candidate classes get instantiated to check whether they are usable.
+
+        :return: True if instantiated
+        :rtype: bool
+        """
+        return self._instantiate_probe
+
+    @instantiate_probe.setter
+    def instantiate_probe(self, probe: bool):
+        """
+        Sets whether to instantiate candidate classes and skip the ones that fail to instantiate
+        (NotImplementedError is still considered usable). Clears the class cache.
+
+        :param probe: True to instantiate
+        :type probe: bool
+        """
+        self._instantiate_probe = probe
+        self._clear_cache()
+
+    @property
+    def cache_dir(self) -> Optional[str]:
+        """
+        Returns the directory for persisting the determined classes across sessions (if any).
+
+        :return: the directory, None if disabled
+        :rtype: str
+        """
+        return self._cache_dir
+
+    @cache_dir.setter
+    def cache_dir(self, cache_dir: Optional[str]):
+        """
+        Sets/unsets the directory for persisting the determined classes across sessions. Clears the class cache.
+
+        :param cache_dir: the directory to use (supports ~), None to disable
+        :type cache_dir: str
+        """
+        if cache_dir is not None:
+            cache_dir = os.path.expanduser(cache_dir)
+        self._cache_dir = cache_dir
+        self._clear_cache()
+
+    def _get_env_value(self, env: Optional[str]) -> Optional[str]:
+        """
+        Returns the value of the environment variable, if a name is set and the variable is non-empty.
+
+        :param env: the name of the environment variable, can be None
+        :type env: str
+        :return: the value, None if variable name not set or variable empty/not present
+        :rtype: str
+        """
+        if not env:
+            return None
+        result = os.getenv(env)
+        if not result:
+            return None
+        return result
 
     def has_env_class_listers(self) -> bool:
         """
@@ -207,10 +331,7 @@ class Registry:
         :return: True if set
         :rtype: bool
         """
-        return (self._env_class_listers is not None) \
-               and (len(self._env_class_listers) > 0) \
-               and (os.getenv(self._env_class_listers) is not None) \
-               and (len(os.getenv(self._env_class_listers)) > 0)
+        return self._get_env_value(self._env_class_listers) is not None
 
     def has_env_excluded_class_listers(self) -> bool:
         """
@@ -219,10 +340,7 @@ class Registry:
         :return: True if set
         :rtype: bool
         """
-        return (self._env_excluded_class_listers is not None) \
-               and (len(self._env_excluded_class_listers) > 0) \
-               and (os.getenv(self._env_excluded_class_listers) is not None) \
-               and (len(os.getenv(self._env_excluded_class_listers)) > 0)
+        return self._get_env_value(self._env_excluded_class_listers) is not None
 
     def _expand_default_class_listers_placeholder(self, c: str) -> str:
         """
@@ -251,8 +369,9 @@ class Registry:
         if (self._custom_class_listers is not None) and (len(self._custom_class_listers) > 0):
             return self._custom_class_listers
 
-        if self.has_env_class_listers():
-            m = self._expand_default_class_listers_placeholder(os.getenv(self.env_class_listers))
+        env_value = self._get_env_value(self._env_class_listers)
+        if env_value is not None:
+            m = self._expand_default_class_listers_placeholder(env_value)
             return [x.strip() for x in m.split(",")]
 
         return self.default_class_listers[:]
@@ -265,48 +384,98 @@ class Registry:
         :return: the list of class listers
         :rtype: list
         """
-        if self.has_env_excluded_class_listers():
-            m = self._expand_default_class_listers_placeholder(os.getenv(self._env_excluded_class_listers))
+        env_value = self._get_env_value(self._env_excluded_class_listers)
+        if env_value is not None:
+            m = self._expand_default_class_listers_placeholder(env_value)
             return [x.strip() for x in m.split(",")]
 
         return self.excluded_class_listers[:]
 
-    def _determine_sub_classes(self, cls: Type, module_name: str) -> List[str]:
+    def _get_module_classes(self, module_name: str) -> Optional[List[Tuple[str, Type]]]:
         """
-        Determines all the sub-classes of type cls in the specified module.
+        Returns the candidate classes (non-abstract, public) defined in the specified module.
+        Each module only gets scanned once, regardless of how many superclasses reference it.
 
-        :param cls: the superclass
-        :param module_name: the module to look for sub-classes
+        :param module_name: the module to scan
         :type module_name: str
-        :return: the list of sub-classes
+        :return: the list of attribute name/class tuples, None if the module failed to import
         :rtype: list
         """
-        result = []
+        if module_name in self._module_classes:
+            return self._module_classes[module_name]
 
+        result = None
         try:
             module = importlib.import_module(module_name)
         except:
             print("Failed to import module: %s" % module_name, file=sys.stderr)
             traceback.print_exc()
-            return result
-
-        for att_name in dir(module):
-            if att_name.startswith("_"):
-                continue
-            if att_name.startswith("Abstract"):
-                continue
-            att = getattr(module, att_name)
-            if inspect.isclass(att) and not inspect.isabstract(att) and issubclass(att, cls):
-                try:
-                    obj = att()
-                except NotImplementedError:
-                    pass
-                except:
-                    print("Problem encountered instantiating: %s" % (module_name + "." + att_name), file=sys.stderr)
-                    traceback.print_exc()
+            module = None
+
+        if module is not None:
+            result = []
+            # snapshot, as other threads may modify the module while scanning
+            for att_name, att in list(vars(module).items()):
+                if not isinstance(att, type):
+                    continue
+                if att_name.startswith(("_", "Abstract")):
                     continue
-                result.append(get_class_name(att))
+                if not inspect.isabstract(att):
+                    result.append((att_name, att))
+
+        self._module_classes[module_name] = result
+        return result
+
+    def _determine_sub_classes(self, cls: Type, module_name: str) -> Iterator[str]:
+        """
+        Determines all the sub-classes of type cls in the specified module.
 
+        :param cls: the superclass
+        :param module_name: the module to look for sub-classes
+        :type module_name: str
+        :return: generator for the sub-classes
+        :rtype: Iterator
+        """
+        module_classes = self._get_module_classes(module_name)
+        if module_classes is None:
+            self._scan_failed = True
+            return
+
+        for att_name, att in module_classes:
+            if issubclass(att, cls):
+                if self._instantiate_probe:
+                    try:
+                        obj = att()
+                    except NotImplementedError:
+                        pass
+                    except:
+                        print("Problem encountered instantiating: %s" % (module_name + "." + att_name), file=sys.stderr)
+                        traceback.print_exc()
+                        continue
+                yield get_class_name(att)
+
+    def _get_class_dict(self, class_lister: str) -> Optional[Dict[str, List[str]]]:
+        """
+        Returns the dictionary generated by the specified class lister, caches the output.
+
+        :param class_lister: the class lister definition to use
+        :type class_lister: str
+        :return: the dictionary of superclass -> modules, None if the class lister failed to load
+        :rtype: dict
+        """
+        if class_lister in self._class_lister_dicts:
+            return self._class_lister_dicts[class_lister]
+
+        result = None
+        try:
+            func = get_class_lister(class_lister)
+        except:
+            print("Problem encountered with class lister: %s" % class_lister, file=sys.stderr)
+            traceback.print_exc()
+            func = None
+        if inspect.isfunction(func):
+            result = func()
+        self._class_lister_dicts[class_lister] = result
         return result
 
     def _determine_from_class_listers(self, c: str, class_listers: List[str]) -> List[str]:
@@ -328,26 +497,19 @@ class Registry:
             except:
                 print("Failed to instantiate class: %s" % c, file=sys.stderr)
                 traceback.print_exc()
+                self._scan_failed = True
                 return result
 
             for class_lister in class_listers:
-                try:
-                    func = get_class_lister(class_lister)
-                except:
-                    print("Problem encountered with class lister: %s" % class_lister, file=sys.stderr)
-                    traceback.print_exc()
+                if class_lister in self._excluded_class_listers_set:
                     continue
 
-                if self.excluded_class_listers is not None:
-                    if class_lister in self.excluded_class_listers:
-                        continue
-
-                if inspect.isfunction(func):
-                    class_dict = func()
-                    if c in class_dict:
-                        for sub_module in class_dict[c]:
-                            sub_classes = self._determine_sub_classes(cls, sub_module)
-                            result.extend(sub_classes)
+                class_dict = self._get_class_dict(class_lister)
+                if class_dict is None:
+                    self._scan_failed = True
+                elif c in class_dict:
+                    for sub_module in class_dict[c]:
+                        result.extend(self._determine_sub_classes(cls, sub_module))
 
         return result
 
@@ -362,9 +524,9 @@ class Registry:
         """
         result = []
         class_listers = []
-        for item in working_set.iter_entry_points("class_lister", None):
+        for item in get_entry_points(ENTRY_POINT_GROUP):
             # format: "name=module:function",
-            class_listers.append(item.module_name + ":" + item.attrs[0])
+            class_listers.append(item.value)
         if len(class_listers) > 0:
             result = self._determine_from_class_listers(c, class_listers)
         return result
@@ -380,13 +542,129 @@ class Registry:
         """
         result = []
 
-        if os.getenv(self.env_class_listers) is not None:
+        env_value = self._get_env_value(self._env_class_listers)
+        if env_value is not None:
             # format: "module:function,module:function,...",
-            class_listers = os.getenv(self.env_class_listers).split(",")
+            class_listers = env_value.split(",")
             result = self._determine_from_class_listers(c, class_listers)
 
         return result
 
+    def _get_cache_file(self) -> str:
+        """
+        Returns the file for persisting the determined classes. The name is derived from the
+        installed distributions, the search path and the class lister setup, so that any
+        change to these results in a different file.
+
+        :return: the cache file
+        :rtype: str
+        """
+        if self._cache_file is None:
+            dists = sorted((str(d.metadata["Name"]), str(d.version)) for d in distributions())
+            setup = (
+                sys.version,
+                sys.path,
+                dists,
+                self.default_class_listers,
+                self.env_class_listers,
+                self._get_env_value(self.env_class_listers),
+                self.excluded_class_listers,
+                self.env_excluded_class_listers,
+                self._get_env_value(self.env_excluded_class_listers),
+                self.custom_class_listers,
+                self.instantiate_probe,
+            )
+            key = hashlib.sha1(repr(setup).encode()).hexdigest()
+            self._cache_file = os.path.join(self._cache_dir, "registry-%s.json" % key)
+        return self._cache_file
+
+    def _is_cache_format_valid(self, cached: Any) -> bool:
+        """
+        Checks whether the loaded cache content is a dictionary of superclass -> list of classes.
+
+        :param cached: the loaded content
+        :return: True if valid
+        :rtype: bool
+        """
+        if not isinstance(cached, dict):
+            return False
+        for k, v in cached.items():
+            if not isinstance(k, str) or not isinstance(v, list):
+                return False
+            for x in v:
+                if not isinstance(x, str):
+                    return False
+        return True
+
+    def _load_cached_classes(self) -> Dict[str, List[str]]:
+        """
+        Returns the classes persisted in the cache file, loads them if necessary.
+
+        :return: the persisted superclass -> classes relation
+        :rtype: dict
+        """
+        if self._cached_classes is None:
+            self._cached_classes = dict()
+            cache_file = self._get_cache_file()
+            if os.path.exists(cache_file):
+                try:
+                    with open(cache_file, "r") as fp:
+                        cached = json.load(fp)
+                    if self._is_cache_format_valid(cached):
+                        self._cached_classes = cached
+                    else:
+                        print("Invalid registry cache format, ignoring: %s" % cache_file, file=sys.stderr)
+                except:
+                    print("Failed to load registry cache: %s" % cache_file, file=sys.stderr)
+                    traceback.print_exc()
+        return self._cached_classes
+
+    def _save_cached_classes(self, c: str, classes: List[str]):
+        """
+        Adds the classes of the superclass to the cache file.
+
+        :param c: the superclass
+        :type c: str
+        :param classes: the determined classes
+        :type classes: list
+        """
+        cached = self._load_cached_classes()
+        cached[c] = classes
+        cache_file = self._get_cache_file()
+        tmp_file = "%s.%d.tmp" % (cache_file, os.getpid())
+        try:
+            os.makedirs(self._cache_dir, exist_ok=True)
+            with open(tmp_file, "w") as fp:
+                json.dump(cached, fp)
+            os.replace(tmp_file, cache_file)
+        except:
+            print("Failed to save registry cache: %s" % cache_file, file=sys.stderr)
+            traceback.print_exc()
+            if os.path.exists(tmp_file):
+                try:
+                    os.remove(tmp_file)
+                except:
+                    pass
+
+    def _is_cache_valid(self, classes: List[str]) -> bool:
+        """
+        Checks whether the modules of the persisted classes can still be found, as changes
+        to code that is not installed as a distribution (e.g., editable installs) do not
+        affect the name of the cache file.
+
+        :param classes: the persisted classes to check
+        :type classes: list
+        :return: True if all modules were found
+        :rtype: bool
+        """
+        for module_name in set(x.rpartition(".")[0] for x in classes):
+            try:
+                if importlib.util.find_spec(module_name) is None:
+                    return False
+            except:
+                return False
+        return True
+
     def _initialize(self, c: str):
         """
         Initializes the class cache for the specified superclass.
@@ -396,6 +674,14 @@ class Registry:
         :return: the list of classes for the superclass
         :rtype: list
         """
+        if self._cache_dir is not None:
+            cached = self._load_cached_classes()
+            if (c in cached) and self._is_cache_valid(cached[c]):
+                self._classes[c] = cached[c]
+                return
+
+        # tracks whether any module/class lister failed, incomplete results don't get persisted
+        self._scan_failed = False
         all_classes = set()
 
         # from entry points
@@ -411,7 +697,10 @@ class Registry:
                     actual.remove(excl)
             all_classes.update(self._determine_from_class_listers(c, actual))
 
-        self._classes[c] = sorted(list(all_classes))
+        self._classes[c] = sorted(all_classes)
+
+        if (self._cache_dir is not None) and (len(self._classes[c]) > 0) and not self._scan_failed:
+            self._save_cached_classes(c, self._classes[c])
 
     def classes(self, c: Union[str, Type], fail_if_empty: bool = True) -> List[str]:
         """
@@ -425,11 +714,10 @@ class Registry:
         """
         if not isinstance(c, str):
             c = get_class_name(c)
-        if c not in self._classes:
+        result = self._classes.get(c)
+        if result is None:
             self._initialize(c)
-        result = []
-        if c in self._classes:
-            result = self._classes[c]
+            result = self._classes.get(c, [])
         if fail_if_empty and (len(result) == 0):
             raise Exception("No classes found for: %s" % c)
         return result
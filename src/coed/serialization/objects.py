@@ -1,9 +1,9 @@
 from typing import Dict, Optional
 
-DICT_READERS = None
+DICT_READERS: Dict = dict()
 """ contains all dictionary readers (class -> reader) """
 
-DICT_WRITERS = None
+DICT_WRITERS: Dict = dict()
 """ contains all dictionary writers (class -> writer) """
 
 
@@ -14,9 +14,6 @@ def get_dict_readers() -> Dict:
     :return: the readers
     :rtype: dict
     """
-    global DICT_READERS
-    if DICT_READERS is None:
-        DICT_READERS = dict()
     return DICT_READERS
 
 
@@ -29,7 +26,7 @@ def add_dict_reader(cls, reader):
     :param reader: the reader method to add
     :type reader: object
     """
-    get_dict_readers()[cls] = reader
+    DICT_READERS[cls] = reader
 
 
 def has_dict_reader(cls) -> bool:
@@ -41,7 +38,7 @@ def has_dict_reader(cls) -> bool:
     :return: true if reader registered
     :rtype: bool
     """
-    return cls in get_dict_readers()
+    return cls in DICT_READERS
 
 
 def get_dict_reader(cls) -> Optional:
@@ -53,10 +50,7 @@ def get_dict_reader(cls) -> Optional:
     :return: the reader method, None if none registered
     :rtype: object
     """
-    if has_dict_reader(cls):
-        return get_dict_readers()[cls]
-    else:
-        return None
+    return DICT_READERS.get(cls)
 
 
 def get_dict_writers() -> Dict:
@@ -66,9 +60,6 @@ def get_dict_writers() -> Dict:
     :return: the writers
     :rtype: dict
     """
-    global DICT_WRITERS
-    if DICT_WRITERS is None:
-        DICT_WRITERS = dict()
     return DICT_WRITERS
 
 
@@ -81,7 +72,7 @@ def add_dict_writer(cls, writer):
     :param writer: the writer method to add
     :type writer: object
     """
-    get_dict_writers()[cls] = writer
+    DICT_WRITERS[cls] = writer
 
 
 def has_dict_writer(cls) -> bool:
@@ -93,7 +84,7 @@ def has_dict_writer(cls) -> bool:
     :return: true if writer registered
     :rtype: bool
     """
-    return cls in get_dict_writers()
+    return cls in DICT_WRITERS
 
 
 def get_dict_writer(cls) -> Optional:
@@ -105,7 +96,4 @@ def get_dict_writer(cls) -> Optional:
     :return: the writer method, None if none registered
     :rtype: object
     """
-    if has_dict_writer(cls):
-        return get_dict_writers()[cls]
-    else:
-        return None
+    return DICT_WRITERS.get(cls)
@@ -1,4 +1,7 @@
+import re
+import sys
 import threading
+from functools import lru_cache
 from typing import Tuple, Any, Set
 from coed.serialization.vars import AbstractStringReader, add_string_reader
 
@@ -17,11 +20,25 @@ VARIABLE_EVENTS = [
 
 VALID_CHARS = "abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789-_"
 
+VALID_CHARS_TABLE = str.maketrans("", "", VALID_CHARS)
+""" translation table that removes all valid characters. """
+
 VAR_START = "@{"
 
 VAR_END = "}"
 
+VAR_START_LEN = len(VAR_START)
+
+VAR_END_LEN = len(VAR_END)
+
+VAR_PATTERN = re.compile(re.escape(VAR_START) + "(.*?)" + re.escape(VAR_END), re.DOTALL)
+""" for locating variable placeholders, the name is checked when expanding. """
+
+_MISSING = object()
+""" sentinel for variables that are not present. """
 
+
+@lru_cache(maxsize=4096)
 def is_valid_name(s: str) -> bool:
     """
     Checks whether the string is a valid variable name.
@@ -31,10 +48,12 @@ def is_valid_name(s: str) -> bool:
     :return: True if valid
     :rtype: bool
     """
-    for i in range(len(s)):
-        if s[i] not in VALID_CHARS:
-            return False
-    return True
+    # fast path: most names are alphanumeric with the odd '-' or '_'
+    stripped = s.replace("_", "").replace("-", "")
+    if stripped.isascii() and stripped.isalnum():
+        return True
+    # also covers empty names and names consisting only of '-' and '_'
+    return len(s.translate(VALID_CHARS_TABLE)) == 0
 
 
 def is_var(s: str) -> bool:
@@ -71,47 +90,58 @@ def unpad_var(s: str) -> str:
     :rtype: str
     """
     if is_var(s):
-        return s[len(VAR_START):len(s) - len(VAR_END)]
+        return s[VAR_START_LEN:len(s) - VAR_END_LEN]
     else:
         return s
 
 
-def _do_expand(s: str, variables: 'Variables') -> Tuple[str, bool]:
+def _may_form_var(value: str) -> bool:
+    """
+    Checks whether inserting the value into a string can result in a new variable placeholder,
+    either within the value itself or together with the surrounding text.
+
+    :param value: the value that gets inserted
+    :type value: str
+    :return: True if a new placeholder is possible
+    :rtype: bool
+    """
+    return (len(value) < VAR_START_LEN) \
+           or (value[0] in VAR_START) \
+           or (value[-1] in VAR_START) \
+           or (VAR_START in value)
+
+
+def _do_expand(s: str, variables: 'Variables') -> Tuple[str, bool, bool]:
     """
     Expands the variable placeholders in the string using the supplied variables.
+    Placeholders of unknown variables get removed.
 
     :param s: the string to expand
     :type s: str
     :param variables: the variables to use for the expansion
     :type variables: Variables
-    :return: the expanded string and whether anything was expanded
-    :rtype: tuple(str, bool)
+    :return: the expanded string, whether anything was expanded and whether the
+             substitutions may have introduced new placeholders
+    :rtype: tuple(str, bool, bool)
     """
-    result = ""
-    expanded = False
-
-    tmp = s
-    while (VAR_START in tmp) and (VAR_END in tmp):
-        start = tmp.find(VAR_START)
-        end = tmp.find(VAR_END, start)
-        if (start == -1) or (end == -1):
-            print("Failed to fully expand: " + s)
-            break
+    nested = False
+
+    def _replace(m):
+        nonlocal nested
+        name = m.group(1)
+        if not is_valid_name(name):
+            raise Exception("Invalid variable name: %s" % name)
+        value = variables._data.get(name, _MISSING)
+        if value is _MISSING:
+            value = ""
         else:
-            name = tmp[start+len(VAR_START):end]
-            result += tmp[0:start]
-            if variables.has(name):
-                result += str(variables.get(name))
-            if len(tmp) == end + 1:
-                tmp = ""
-            else:
-                tmp = tmp[end+1:]
-            expanded = True
+            value = str(value)
+        if not nested:
+            nested = _may_form_var(value)
+        return value
 
-    if len(tmp) > 0:
-        result += tmp
-
-    return result, expanded
+    result, num = VAR_PATTERN.subn(_replace, s)
+    return result, num > 0, nested
 
 
 def expand(s: str, variables: 'Variables') -> str:
@@ -125,10 +155,13 @@ def expand(s: str, variables: 'Variables') -> str:
     :return: the expanded string
     :rtype: str
     """
+    if VAR_START not in s:
+        return s
+
     result = s
     while True:
-        result, expanded = _do_expand(result, variables)
-        if not expanded:
+        result, expanded, nested = _do_expand(result, variables)
+        if not expanded or not nested:
             break
         if VAR_START not in result:
             break
@@ -194,6 +227,9 @@ class VariableNameStringReader(AbstractStringReader):
         :param base_type: optional type when reconstructing lists etc
         :return: the generated object
         """
+        # already validated?
+        if isinstance(s, VariableName):
+            return s
         return VariableName(s)
 
 
@@ -222,8 +258,8 @@ class Variables:
         Initializes the variables.
         """
         self._data = dict()
-        self._listeners = set()
-        self._variables_mutex = threading.Semaphore(1)
+        self._listeners = list()
+        self._variables_mutex = threading.RLock()
 
     def add_listener(self, l: VariableChangeListener):
         """
@@ -234,7 +270,8 @@ class Variables:
         :return: itself
         :rtype: Variables
         """
-        self._listeners.add(l)
+        if l not in self._listeners:
+            self._listeners.append(l)
         return self
 
     def remove_listener(self, l: VariableChangeListener) -> 'Variables':
@@ -267,10 +304,10 @@ class Variables:
         :return: itself
         :rtype: Variables
         """
-        self._variables_mutex.acquire()
-        self._data.clear()
-        self._variables_mutex.release()
-        self._notify_listeners(VariableChangeEvent(self, VARIABLE_EVENT_CLEARED))
+        with self._variables_mutex:
+            self._data.clear()
+        if self._listeners:
+            self._notify_listeners(VariableChangeEvent(self, VARIABLE_EVENT_CLEARED))
         return self
 
     def has(self, key: str) -> bool:
@@ -284,10 +321,8 @@ class Variables:
         """
         if not is_valid_name(key):
             raise Exception("Invalid variable name: %s" + key)
-        self._variables_mutex.acquire()
-        result = key in self._data
-        self._variables_mutex.release()
-        return result
+        # dict lookups are atomic, no need to lock
+        return key in self._data
 
     def set(self, key: str, value: Any) -> 'Variables':
         """
@@ -302,15 +337,17 @@ class Variables:
         """
         if not is_valid_name(key):
             raise Exception("Invalid variable name: %s" + key)
-        self._variables_mutex.acquire()
-        if key not in self._data:
-            self._data[key] = value
-            event = VARIABLE_EVENT_ADDED
-        else:
-            self._data[key] = value
-            event = VARIABLE_EVENT_UPDATED
-        self._variables_mutex.release()
-        self._notify_listeners(VariableChangeEvent(self, event, key))
+        # interned keys speed up subsequent lookups (str() as VariableName cannot be interned)
+        key = sys.intern(str(key))
+        with self._variables_mutex:
+            if key not in self._data:
+                self._data[key] = value
+                event = VARIABLE_EVENT_ADDED
+            else:
+                self._data[key] = value
+                event = VARIABLE_EVENT_UPDATED
+        if self._listeners:
+            self._notify_listeners(VariableChangeEvent(self, event, key))
         return self
 
     def get(self, key: str) -> Any:
@@ -324,12 +361,8 @@ class Variables:
         """
         if not is_valid_name(key):
             raise Exception("Invalid variable name: %s" + key)
-        result = None
-        self._variables_mutex.acquire()
-        if key in self._data:
-            result = self._data[key]
-        self._variables_mutex.release()
-        return result
+        # dict lookups are atomic, no need to lock
+        return self._data.get(key)
 
     def remove(self, key: str) -> 'Variables':
         """
@@ -342,13 +375,12 @@ class Variables:
         """
         if not is_valid_name(key):
             raise Exception("Invalid variable name: %s" + key)
-        self._variables_mutex.acquire()
         event = None
-        if key in self._data:
-            del self._data[key]
-            event = VARIABLE_EVENT_DELETED
-        self._variables_mutex.release()
-        if event is not None:
+        with self._variables_mutex:
+            if key in self._data:
+                del self._data[key]
+                event = VARIABLE_EVENT_DELETED
+        if (event is not None) and self._listeners:
             self._notify_listeners(VariableChangeEvent(self, event, key))
         return self
 
@@ -359,10 +391,19 @@ class Variables:
         :return: the set of names
         :rtype: set
         """
-        self._variables_mutex.acquire()
-        result = set(self._data.keys())
-        self._variables_mutex.release()
-        return result
+        # copying the keys happens in a single C-level call, no need to lock
+        return set(self._data)
+
+    def iter_keys(self) -> Tuple[str, ...]:
+        """
+        Returns a snapshot of the names of the currently stored variables,
+        for callers that only need to iterate them.
+
+        :return: the tuple of names
+        :rtype: tuple
+        """
+        # copying the keys happens in a single C-level call, no need to lock
+        return tuple(self._data)
 
     def expand(self, s: str) -> str:
         """
@@ -384,10 +425,24 @@ class Variables:
         :return: itself
         :rtype: Variables
         """
-        self._variables_mutex.acquire()
-        for key in variables.keys():
-            self.set(key, variables.get(key))
-        self._variables_mutex.release()
+        if variables is self:
+            return self
+
+        # always lock in the same order to avoid deadlocks with concurrent merges
+        if id(self) < id(variables):
+            first, second = self, variables
+        else:
+            first, second = variables, self
+        events = []
+        with first._variables_mutex, second._variables_mutex:
+            if self._listeners:
+                for key in variables._data:
+                    events.append((key, VARIABLE_EVENT_UPDATED if key in self._data else VARIABLE_EVENT_ADDED))
+            # names have already been validated when they were set
+            self._data.update(variables._data)
+
+        for key, event in events:
+            self._notify_listeners(VariableChangeEvent(self, event, key))
         return self
 
     def _notify_listeners(self, event: VariableChangeEvent):
@@ -397,7 +452,8 @@ class Variables:
         :param event: the event to send
         :type event: VariableChangeEvent
         """
-        for l in self._listeners:
+        # snapshot, as listeners may add/remove listeners
+        for l in tuple(self._listeners):
             l.variables_changed(event)
 
     def __str__(self) -> str: